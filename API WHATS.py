@@ -50,6 +50,26 @@ GET_TIMEOUT = 30
 MAX_RETRIES_HTTP = 3
 TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # Renovar token 5min antes de expirar
 
+# Pré-validação local (números que nunca voltariam válidos não são enviados)
+CODIGO_PAIS = "55"
+DDDS_VALIDOS = frozenset(str(d) for d in (
+    11, 12, 13, 14, 15, 16, 17, 18, 19,
+    21, 22, 24, 27, 28,
+    31, 32, 33, 34, 35, 37, 38,
+    41, 42, 43, 44, 45, 46, 47, 48, 49,
+    51, 53, 54, 55,
+    61, 62, 63, 64, 65, 66, 67, 68, 69,
+    71, 73, 74, 75, 77, 79,
+    81, 82, 83, 84, 85, 86, 87, 88, 89,
+    91, 92, 93, 94, 95, 96, 97, 98, 99,
+))
+MOTIVO_VAZIO = "VAZIO"
+MOTIVO_TAMANHO = "TAMANHO_INVALIDO"
+MOTIVO_DDD = "DDD_INVALIDO"
+MOTIVO_FIXO = "FIXO"
+MOTIVO_ASSINANTE = "ASSINANTE_INVALIDO"
+MOTIVO_NONO_DIGITO = "NONO_DIGITO_INVALIDO"
+
 # logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -79,8 +99,8 @@ def save_acoes_db(acoes: Dict[str, dict]):
         logging.error(f"Erro ao salvar banco de ações: {e}")
 
 
-def add_acao_pendente(id_acao: int, file_path: Path, centro_custo: str):
-    """Adiciona uma ação pendente ao banco de dados"""
+def add_acao_pendente(id_acao: int, file_path: Path, centro_custo: str, arquivo_pre_validacao: Optional[Path] = None):
+    """Adiciona uma ação pendente ao banco de dados (com o arquivo da pré-validação)"""
     acoes = load_acoes_db()
     acoes[str(id_acao)] = {
         "idAcaoEnvio": id_acao,
@@ -90,7 +110,8 @@ def add_acao_pendente(id_acao: int, file_path: Path, centro_custo: str):
         "data_criacao": datetime.now().isoformat(),
         "status": "pendente",
         "tentativas": 0,
-        "ultima_verificacao": None
+        "ultima_verificacao": None,
+        "arquivo_pre_validacao": str(arquivo_pre_validacao) if arquivo_pre_validacao else None
     }
     save_acoes_db(acoes)
     logging.info(f"Ação {id_acao} adicionada ao banco de dados pendentes")
@@ -133,6 +154,52 @@ def normalize_phone_raw(s: Optional[str]) -> Optional[str]:
     digits = "".join(ch for ch in st if ch.isdigit())
     return digits if digits else None
 
+def pre_validar_destinatarios(serie: pd.Series) -> pd.DataFrame:
+    """
+    Canoniza uma coluna de destinatários para E.164 (sem '+') e marca os
+    números que nunca seriam WhatsApp válidos.
+    Adiciona o código do país (55) e o nono dígito de celular quando faltam.
+    Retorna um DataFrame com o mesmo índice e colunas "Numero" (dígitos
+    originais), "E164" (canônico ou None) e "Motivo" (None se válido).
+    """
+    numero = serie.map(normalize_phone_raw).astype(object)
+    numero = numero.where(numero.notna(), None)
+    digitos = numero.fillna("").str.lstrip("0")
+    tamanho = digitos.str.len()
+
+    # Remove o código do país: 12/13 dígitos começando com 55 viram 10/11
+    com_pais = tamanho.isin([12, 13]) & digitos.str.startswith(CODIGO_PAIS)
+    nacional = digitos.where(~com_pais, digitos.str[len(CODIGO_PAIS):])
+    tamanho = nacional.str.len()
+
+    ddd = nacional.str[:2]
+    assinante = nacional.str[2:]
+    primeiro = assinante.str[:1]
+
+    # Celular antigo (8 dígitos começando com 6-9) ganha o nono dígito
+    sem_nono = (tamanho == 10) & primeiro.isin(list("6789"))
+    assinante = assinante.where(~sem_nono, "9" + assinante)
+
+    motivo = pd.Series(None, index=serie.index, dtype=object)
+    motivo[(tamanho == 11) & (primeiro != "9")] = MOTIVO_NONO_DIGITO
+    motivo[(tamanho == 10) & primeiro.isin(list("2345"))] = MOTIVO_FIXO
+    motivo[(tamanho == 10) & primeiro.isin(list("01"))] = MOTIVO_ASSINANTE
+    motivo[tamanho.isin([10, 11]) & ~ddd.isin(DDDS_VALIDOS)] = MOTIVO_DDD
+    motivo[~tamanho.isin([10, 11])] = MOTIVO_TAMANHO
+    motivo[numero.isna()] = MOTIVO_VAZIO
+
+    e164 = (CODIGO_PAIS + ddd + assinante).astype(object).where(motivo.isna(), None)
+    return pd.DataFrame({"Numero": numero, "E164": e164, "Motivo": motivo})
+
+def montar_resumo(pre: pd.DataFrame, tem_zap_por_numero: Dict[str, str]) -> pd.DataFrame:
+    """
+    Monta o RESUMO a partir da pré-validação: mantém o número original de cada linha,
+    busca o resultado da API pelo número canônico e marca os rejeitados como NAO.
+    """
+    tem_zap = pre["E164"].map(tem_zap_por_numero).fillna("NAO")
+    motivo = pre["Motivo"].fillna("")
+    return pd.DataFrame({"Numero": pre["Numero"], "Tem Zap": tem_zap, "Motivo": motivo})
+
 def determine_tem_zap_from_item(item: dict) -> str:
     try:
         status = str(item.get("statusRetornoEnvio", "") or "").upper()
@@ -293,11 +360,6 @@ def incluir_arquivo_para_validacao(file_path: Path):
     """
     logging.info(f"📤 Incluindo arquivo: {file_path.name}")
     
-    # Verificar e renovar token antes de processar
-    if not verificar_renovar_token():
-        logging.error("Falha ao obter/renovar token. Não é possível processar arquivo.")
-        return {"file": str(file_path), "error": "auth_failed"}
-    
     df = try_read_csv(file_path)
     if df is None:
         return {"file": str(file_path), "error": "read_failed"}
@@ -309,6 +371,34 @@ def incluir_arquivo_para_validacao(file_path: Path):
         logging.error(f"Arquivo {file_path.name} não tem coluna 'Destinatario'.")
         return {"file": str(file_path), "error": "missing Destinatario"}
 
+    # Pré-validação local: rejeitados vão direto como NAO no FINAL, sem upload
+    pre = pre_validar_destinatarios(df[dest_col])
+    mask_validos = pre["Motivo"].isna()
+    rejeitados = int((~mask_validos).sum())
+    if rejeitados:
+        logging.info(f"🚫 {rejeitados} número(s) rejeitado(s) na pré-validação de {file_path.name}: "
+                     f"{pre.loc[~mask_validos, 'Motivo'].value_counts().to_dict()}")
+
+    if not mask_validos.any():
+        out_path_resumo = salvar_arquivo_final(file_path, montar_resumo(pre, {}))
+        logging.info(f"💾 Nenhum número válido em {file_path.name}; arquivo RESUMO salvo sem envio: {out_path_resumo.name}")
+        try:
+            file_path.unlink(missing_ok=True)
+        except Exception as e:
+            logging.exception(f"❌ Falha ao remover arquivo original {file_path}: {e}")
+        return {
+            "file": str(file_path),
+            "output_resumo": str(out_path_resumo),
+            "rows": len(pre),
+            "rejeitados": rejeitados,
+            "status": "pre_validado"
+        }
+
+    # Verificar e renovar token antes de enviar
+    if not verificar_renovar_token():
+        logging.error("Falha ao obter/renovar token. Não é possível processar arquivo.")
+        return {"file": str(file_path), "error": "auth_failed"}
+
     # Var1 -> CentroCusto
     var1_col = next((c for c in df.columns if c.strip().upper() == "VAR1"), None)
     centro_custo = ""
@@ -318,6 +408,9 @@ def incluir_arquivo_para_validacao(file_path: Path):
             centro_custo = str(vals.iloc[0]).strip()
         df[var1_col] = pd.NA
 
+    df = df.loc[mask_validos].copy()
+    df[dest_col] = pre.loc[mask_validos, "E164"]
+
     tmp_fd, tmp_path = tempfile.mkstemp(suffix=".csv")
     os.close(tmp_fd)
     tmp_file = Path(tmp_path)
@@ -345,8 +438,17 @@ def incluir_arquivo_para_validacao(file_path: Path):
         tmp_file.unlink(missing_ok=True)
         return {"file": str(file_path), "error": "no_idAcaoEnvio"}
 
+    # Guardar a pré-validação (número original + canônico) para montar o FINAL na fase 2
+    # Se falhar, a ação é registrada mesmo assim e a fase 2 usa apenas os itens da UNO
+    arquivo_pre_validacao = PENDING_FOLD / f"{id_acao}_pre_validacao.csv"
+    try:
+        pre.to_csv(arquivo_pre_validacao, sep=";", index=False, encoding="utf-8")
+    except Exception as e:
+        logging.exception(f"❌ Falha ao salvar pré-validação {arquivo_pre_validacao}: {e}")
+        arquivo_pre_validacao = None
+
     # Adicionar ação ao banco de dados pendentes
-    add_acao_pendente(id_acao, file_path, centro_custo)
+    add_acao_pendente(id_acao, file_path, centro_custo, arquivo_pre_validacao)
     
     # === REMOVER O ARQUIVO ORIGINAL da pasta WATCH_FOLDER para evitar reenvio ===
     arquivo_movido_flag = False
@@ -371,6 +473,7 @@ def incluir_arquivo_para_validacao(file_path: Path):
         "idAcaoEnvio": id_acao, 
         "arquivo_movido": arquivo_movido_flag,
         "arquivo_original": str(file_path),
+        "rejeitados": rejeitados,
         "status": "enviado"
     }
 
@@ -419,7 +522,7 @@ def verificar_resultado_acao(id_acao: int) -> Optional[dict]:
             # Se pelo menos um item foi validado, consideramos que está pronto
             if status_retorno in ["Validado", "Processada", "Enviado"]:
                 logging.info(f"✅ Ação {id_acao} está pronta! Status: {status_retorno}")
-                resultado = processar_resultado_acao(id_acao, items, file_path)
+                resultado = processar_resultado_acao(id_acao, items, file_path, acao_info.get("arquivo_pre_validacao"))
                 return resultado
             else:
                 # Ainda está processando
@@ -437,11 +540,10 @@ def verificar_resultado_acao(id_acao: int) -> Optional[dict]:
     return None
 
 
-def processar_resultado_acao(id_acao: int, items: List[dict], file_path: Path) -> dict:
+def salvar_arquivo_final(file_path: Path, df_resumo: pd.DataFrame) -> Path:
     """
-    Processa os resultados de uma ação e salva o arquivo RESUMO com sufixo _FINAL.
-    Arquivo original já foi renomeado com _ORIGINAL na Fase 1.
-    O arquivo RESUMO usa apenas o nome base (sem timestamp nem _ORIGINAL) + _FINAL.
+    Salva o arquivo RESUMO na pasta FINAL.
+    O arquivo RESUMO usa apenas o nome base (sem timestamp nem _ORIGINAL) precedido da data atual.
     """
     data_atual = datetime.now().strftime('%Y%m%d_%H%M%S')
     
@@ -463,23 +565,53 @@ def processar_resultado_acao(id_acao: int, items: List[dict], file_path: Path) -
         nome_original = '_'.join(partes[2:])  # Pega tudo depois do timestamp
     else:
         nome_original = nome_sem_original
+
+    nome_arquivo_resumo = f"{data_atual}_{nome_original}.csv"
+    out_path_resumo = FINAL_FOLDER / nome_arquivo_resumo
+    df_resumo.to_csv(out_path_resumo, sep=";", index=False, encoding="utf-8")
+    return out_path_resumo
+
+
+def processar_resultado_acao(id_acao: int, items: List[dict], file_path: Path, arquivo_pre_validacao: Optional[str] = None) -> dict:
+    """
+    Processa os resultados de uma ação e salva o arquivo RESUMO na pasta FINAL.
+    Com o arquivo da pré-validação, cada linha mantém o número original enviado pelo usuário
+    e os números rejeitados entram como NAO, com o motivo da rejeição.
+    """
     
     # ========================================
     # ARQUIVO RESUMO (Numero + Tem Zap)
     # ========================================
-    results_resumo = []
+    numeros = []
+    tem_zaps = []
     for it in items:
         numero_raw = it.get("destinatario") or it.get("numero") or it.get("idMailingEnvio") or it.get("id")
-        numero = normalize_phone_raw(numero_raw)
-        tem_zap = determine_tem_zap_from_item(it)
-        results_resumo.append({"Numero": numero, "Tem Zap": tem_zap})
-
-    df_resumo = pd.DataFrame(results_resumo, columns=["Numero", "Tem Zap"])
-    
-    # Salvar arquivo resumo com sufixo _FINAL
-    nome_arquivo_resumo = f"{data_atual}_{nome_original}.csv"
-    out_path_resumo = FINAL_FOLDER / nome_arquivo_resumo
-    df_resumo.to_csv(out_path_resumo, sep=";", index=False, encoding="utf-8")
+        numeros.append(normalize_phone_raw(numero_raw))
+        tem_zaps.append(determine_tem_zap_from_item(it))
+
+    pre = None
+    pre_path = Path(arquivo_pre_validacao) if arquivo_pre_validacao else None
+    if pre_path is not None:
+        if pre_path.exists():
+            pre = try_read_csv(pre_path)
+        if pre is None:
+            # Mantém o arquivo para não perder os números originais e os rejeitados
+            logging.error(f"❌ Não foi possível ler a pré-validação {pre_path}; usando apenas os itens da UNO")
+
+    if pre is not None:
+        # A UNO devolve o número canônico: indexar pelo E.164 para voltar ao número original
+        canonicos = pre_validar_destinatarios(pd.Series(numeros, dtype=object))["E164"]
+        tem_zap_por_numero = {}
+        for numero, canonico, tem_zap in zip(numeros, canonicos, tem_zaps):
+            chave = canonico or numero
+            if tem_zap == "SIM" or chave not in tem_zap_por_numero:
+                tem_zap_por_numero[chave] = tem_zap
+        df_resumo = montar_resumo(pre, tem_zap_por_numero)
+    else:
+        df_resumo = pd.DataFrame({"Numero": numeros, "Tem Zap": tem_zaps, "Motivo": ""},
+                                 columns=["Numero", "Tem Zap", "Motivo"])
+    out_path_resumo = salvar_arquivo_final(file_path, df_resumo)
+    rejeitados = int((df_resumo["Motivo"] != "").sum())
     
     # ========================================
     # ESTATÍSTICAS
@@ -492,6 +624,8 @@ def processar_resultado_acao(id_acao: int, items: List[dict], file_path: Path) -
 
     # Remover ação do banco de dados pendentes
     remove_acao_pendente(id_acao)
+    if pre is not None:
+        pre_path.unlink(missing_ok=True)
     
     return {
         "file": str(file_path), 
@@ -500,6 +634,7 @@ def processar_resultado_acao(id_acao: int, items: List[dict], file_path: Path) -
         "rows": len(df_resumo),
         "whatsapp": total_sim,
         "sem_whatsapp": total_nao,
+        "rejeitados": rejeitados,
         "status": "completed"
     }
 